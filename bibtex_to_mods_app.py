@@ -1,69 +1,176 @@
 
+import multiprocessing
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
 import streamlit as st
 import bibtexparser
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from bibtexparser.middlewares import LatexDecodingMiddleware, NormalizeFieldKeys, SeparateCoAuthors
+from bibtexparser.middlewares.names import parse_single_name_into_parts
+from pylatexenc.latex2text import LatexNodes2Text
+
+MODS_NS = "http://www.loc.gov/mods/v3"
+
+# Record fragments, already indented for their depth inside <modsCollection>.
+MODS_START = "  <mods>\n"
+MODS_END = "  </mods>\n"
+TITLE_INFO = "    <titleInfo>\n      <title>%s</title>\n    </titleInfo>\n"
+PERSONAL_NAME_START = '    <name type="personal">\n'
+CORPORATE_NAME_START = '    <name type="corporate">\n'
+NAME_PART = "      <namePart>%s</namePart>\n"
+TYPED_NAME_PART = '      <namePart type="%s">%s</namePart>\n'
+NAME_END = (
+    "      <role>\n"
+    '        <roleTerm type="text">author</roleTerm>\n'
+    "      </role>\n"
+    "    </name>\n"
+)
+ORIGIN_INFO = "    <originInfo>\n      <dateIssued>%s</dateIssued>\n    </originInfo>\n"
+RELATED_ITEM = (
+    '    <relatedItem type="host">\n'
+    "      <titleInfo>\n        <title>%s</title>\n      </titleInfo>\n"
+    "    </relatedItem>\n"
+)
+DOI_IDENTIFIER = '    <identifier type="doi">%s</identifier>\n'
+ABSTRACT = "    <abstract>%s</abstract>\n"
+GENRE = "    <genre>%s</genre>\n"
+TYPE_OF_RESOURCE = "    <typeOfResource>text</typeOfResource>\n"
+
+# Anything outside the XML 1.0 Char production.
+INVALID_XML_CHARS = re.compile("[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+COLLECTION_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<modsCollection xmlns="%s">\n' % MODS_NS
+)
+COLLECTION_END = "</modsCollection>\n"
+
+# LatexDecodingMiddleware skips name lists, so names are decoded after
+# splitting.
+LATEX_DECODER = LatexNodes2Text()
 
 st.title("BibTeX naar MODS XML Converter")
 
-uploaded_file = st.file_uploader("Upload een BibTeX-bestand (.bib)", type="bib")
-
-def bibtex_to_mods_string(bibtex_content):
-    bib_database = bibtexparser.loads(bibtex_content)
-
-    mods_ns = "http://www.loc.gov/mods/v3"
-    ET.register_namespace('', mods_ns)
-    mods_collection = ET.Element('{%s}modsCollection' % mods_ns)
-
+uploaded_files = st.file_uploader("Upload een of meer BibTeX-bestanden (.bib)", type="bib", accept_multiple_files=True)
+
+def xml_text(value, field):
+    # escape() only handles markup characters; refuse control characters
+    # rather than writing a document no XML parser will accept.
+    invalid = INVALID_XML_CHARS.search(value)
+    if invalid:
+        raise ValueError("field %r contains U+%04X, which XML does not allow" % (field, ord(invalid.group())))
+    return escape(value)
+
+def corporate_name(name):
+    # A name protected by a single pair of braces, e.g. {World Health Organization}.
+    if name.first or name.von or name.jr or len(name.last) != 1:
+        return None
+    last = name.last[0]
+    if last.startswith('{') and last.endswith('}'):
+        return LATEX_DECODER.latex_to_text(last)
+    return None
+
+def split_name(name):
+    family = LATEX_DECODER.latex_to_text(' '.join(name.von + name.last))
+    given = LATEX_DECODER.latex_to_text(' '.join(name.first))
+    suffix = LATEX_DECODER.latex_to_text(' '.join(name.jr))
+    return family, given, suffix
+
+def entry_to_mods(entry):
+    parts = [MODS_START]
+
+    if 'title' in entry:
+        parts.append(TITLE_INFO % xml_text(entry['title'], 'title'))
+
+    if 'author' in entry:
+        for author in entry['author']:
+            # Non-strict, so one odd name doesn't drop the whole entry.
+            name = parse_single_name_into_parts(author, strict=False)
+            corporate = corporate_name(name)
+            if corporate:
+                parts.append(CORPORATE_NAME_START)
+                parts.append(NAME_PART % xml_text(corporate, 'author'))
+            else:
+                family, given, suffix = split_name(name)
+                parts.append(PERSONAL_NAME_START)
+                if family:
+                    parts.append(TYPED_NAME_PART % ("family", xml_text(family, 'author')))
+                if given:
+                    parts.append(TYPED_NAME_PART % ("given", xml_text(given, 'author')))
+                if suffix:
+                    parts.append(TYPED_NAME_PART % ("termsOfAddress", xml_text(suffix, 'author')))
+            parts.append(NAME_END)
+
+    if 'year' in entry:
+        parts.append(ORIGIN_INFO % xml_text(entry['year'], 'year'))
+
+    if 'journal' in entry:
+        parts.append(RELATED_ITEM % xml_text(entry['journal'], 'journal'))
+
+    if 'doi' in entry:
+        parts.append(DOI_IDENTIFIER % xml_text(entry['doi'], 'doi'))
+
+    if 'abstract' in entry:
+        parts.append(ABSTRACT % xml_text(entry['abstract'], 'abstract'))
+
+    parts.append(GENRE % xml_text(entry.entry_type or 'article', 'entry type'))
+    parts.append(TYPE_OF_RESOURCE)
+    parts.append(MODS_END)
+
+    return "".join(parts)
+
+def bibtex_to_mods_records(bibtex_bytes):
+    # bibtexparser only parses str, so decode here: in a pool worker the
+    # decoded copy then lives in that worker rather than in the Streamlit
+    # process.
+    bibtex_content = bibtex_bytes.decode("utf-8")
+    bib_database = bibtexparser.parse_string(
+        bibtex_content,
+        append_middleware=[NormalizeFieldKeys(), SeparateCoAuthors(), LatexDecodingMiddleware()],
+    )
+
+    records = []
     for entry in bib_database.entries:
-        mods = ET.SubElement(mods_collection, '{%s}mods' % mods_ns)
-
-        if 'title' in entry:
-            title_info = ET.SubElement(mods, '{%s}titleInfo' % mods_ns)
-            title = ET.SubElement(title_info, '{%s}title' % mods_ns)
-            title.text = entry['title']
-
-        if 'author' in entry:
-            authors = [a.strip() for a in entry['author'].replace('\n', ' ').split(' and ')]
-            for author in authors:
-                name = ET.SubElement(mods, '{%s}name' % mods_ns, type="personal")
-                name_part = ET.SubElement(name, '{%s}namePart' % mods_ns)
-                name_part.text = author
-                role = ET.SubElement(name, '{%s}role' % mods_ns)
-                role_term = ET.SubElement(role, '{%s}roleTerm' % mods_ns, type="text")
-                role_term.text = "author"
-
-        if 'year' in entry:
-            origin_info = ET.SubElement(mods, '{%s}originInfo' % mods_ns)
-            date_issued = ET.SubElement(origin_info, '{%s}dateIssued' % mods_ns)
-            date_issued.text = entry['year']
-
-        if 'journal' in entry:
-            related_item = ET.SubElement(mods, '{%s}relatedItem' % mods_ns, type="host")
-            title_info = ET.SubElement(related_item, '{%s}titleInfo' % mods_ns)
-            title = ET.SubElement(title_info, '{%s}title' % mods_ns)
-            title.text = entry['journal']
-
-        if 'doi' in entry:
-            identifier = ET.SubElement(mods, '{%s}identifier' % mods_ns, type="doi")
-            identifier.text = entry['doi']
-
-        if 'abstract' in entry:
-            abstract = ET.SubElement(mods, '{%s}abstract' % mods_ns)
-            abstract.text = entry['abstract']
-
-        genre = ET.SubElement(mods, '{%s}genre' % mods_ns)
-        genre.text = entry.get('ENTRYTYPE', 'article')
-
-        resource_type = ET.SubElement(mods, '{%s}typeOfResource' % mods_ns)
-        resource_type.text = "text"
-
-    rough_string = ET.tostring(mods_collection, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
-
-if uploaded_file:
-    bib_content = uploaded_file.read().decode("utf-8")
-    mods_xml = bibtex_to_mods_string(bib_content)
+        try:
+            records.append(entry_to_mods(entry))
+        except ValueError as exc:
+            raise ValueError("Entry %r: %s" % (entry.key, exc)) from None
+    return "".join(records)
+
+def convert_all(bib_files):
+    if len(bib_files) == 1:
+        return [bibtex_to_mods_records(bib_files[0])]
+    # On Linux, fork so the workers start without re-running this script.
+    # Forking the threaded Streamlit server is not strictly safe: a lock held
+    # by another thread at fork time stays locked in the child, and Python
+    # 3.12+ warns about it. The workers only parse and format strings, so the
+    # faster start-up is worth that risk here. Other platforms use their
+    # default start method.
+    if sys.platform.startswith("linux"):
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = None
+    max_workers = min(len(bib_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        return list(executor.map(bibtex_to_mods_records, bib_files))
+
+# Streamlit reruns the whole script on every widget interaction; cache the
+# result so unchanged uploads are not converted again. Keep the cache
+# bounded, as every entry holds a complete XML document.
+@st.cache_data(show_spinner=False, max_entries=16)
+def bibtex_to_mods_string(bib_files):
+    # All uploaded files end up in a single <modsCollection>.
+    return "".join([COLLECTION_START, *convert_all(bib_files), COLLECTION_END])
+
+if uploaded_files:
+    bib_files = [f.getvalue() for f in uploaded_files]
+    try:
+        mods_xml = bibtex_to_mods_string(bib_files)
+    except ValueError as exc:
+        st.error(str(exc))
+        st.stop()
     st.download_button("Download MODS XML", mods_xml, file_name="mods_output.xml", mime="application/xml")
     st.code(mods_xml, language="xml")
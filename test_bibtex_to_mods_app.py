@@ -0,0 +1,46 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from bibtex_to_mods_app import MODS_NS, bibtex_to_mods_records, bibtex_to_mods_string
+
+NS = {"mods": MODS_NS}
+
+
+def test_markup_and_astral_characters_round_trip():
+    bib = (
+        "@article{tricky,\n"
+        "  author = {O'Brien, Seán and {Café <\\&> Co}},\n"
+        "  title = {Fish \\& Chips <b> ]]> \U0001F41F \U0001D518},\n"
+        "  journal = {\"Quoted\" \\& <Journal>},\n"
+        "  abstract = {a ]]> b \U0001F600},\n"
+        "}\n"
+    )
+    root = ET.fromstring(bibtex_to_mods_string([bib.encode("utf-8")]))
+
+    mods = root.find("mods:mods", NS)
+    assert mods.findtext("mods:titleInfo/mods:title", namespaces=NS) == "Fish & Chips <b> ]]> \U0001F41F \U0001D518"
+    assert mods.findtext("mods:relatedItem/mods:titleInfo/mods:title", namespaces=NS) == "\"Quoted\" & <Journal>"
+    assert mods.findtext("mods:abstract", namespaces=NS) == "a ]]> b \U0001F600"
+    names = mods.findall("mods:name", NS)
+    assert names[0].get("type") == "personal"
+    assert names[0].findtext("mods:namePart[@type='family']", namespaces=NS) == "O'Brien"
+    assert names[1].get("type") == "corporate"
+    assert names[1].findtext("mods:namePart", namespaces=NS) == "Café <&> Co"
+
+
+def test_files_share_one_collection():
+    root = ET.fromstring(bibtex_to_mods_string([b"@book{a, title={A}}", b"@book{b, title={B}}"]))
+    titles = [t.text for t in root.iterfind("mods:mods/mods:titleInfo/mods:title", NS)]
+    assert titles == ["A", "B"]
+
+
+def test_suffix_is_kept():
+    root = ET.fromstring("<c xmlns='%s'>%s</c>" % (MODS_NS, bibtex_to_mods_records(b"@book{a, author={Smith, Jr., John}}")))
+    name = root.find("mods:mods/mods:name", NS)
+    assert name.findtext("mods:namePart[@type='termsOfAddress']", namespaces=NS) == "Jr."
+
+
+def test_characters_outside_xml_are_rejected_with_entry_and_field():
+    with pytest.raises(ValueError, match=r"Entry 'bad': field 'title' contains U\+000C"):
+        bibtex_to_mods_records(b"@article{bad, title={Form\x0cfeed}}")